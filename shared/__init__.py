@@ -0,0 +1 @@
+"""Helpers shared by the assignment agents (caching, telemetry, client control)."""
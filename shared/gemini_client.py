@@ -0,0 +1,370 @@
+"""Rate-limit-aware shared Gemini client.
+
+``get_gemini_client()`` returns one process-wide ``AsyncOpenAI`` client for the
+Gemini OpenAI-compatible endpoint. Its HTTP transport:
+
+- limits requests and tokens per minute with token buckets
+- adapts concurrency AIMD-style: additive increase on fast successes,
+  multiplicative decrease on 429/503s or slow responses (timed until the body is closed)
+- retries 429/5xx and connection errors with jittered backoff, honouring Retry-After
+- serves waiting requests by priority, so interactive sessions go ahead of batch jobs
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import email.utils
+import heapq
+import itertools
+import json
+import os
+import random
+import time
+from typing import AsyncIterator, Callable, Iterator
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from shared.telemetry import Telemetry
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+
+INTERACTIVE = 0
+BATCH = 10
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Statuses that mean the server is overloaded, not just failing
+THROTTLE_STATUSES = {429, 503}
+
+request_priority: contextvars.ContextVar[int] = contextvars.ContextVar("request_priority", default=INTERACTIVE)
+
+
+@contextlib.contextmanager
+def priority(level: int) -> Iterator[None]:
+    """Run the enclosed model calls at ``level`` (lower is served first)."""
+    token = request_priority.set(level)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+# ------------------ Limiter ------------------
+
+class TokenBucket:
+    """Refills ``rate_per_minute`` units per minute up to ``capacity``."""
+
+    def __init__(self, rate_per_minute: float, capacity: float | None = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        """Refund (positive) or charge (negative) ``amount`` after the fact."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AdaptiveLimiter:
+    """Priority queue in front of token buckets and an AIMD concurrency limit."""
+
+    def __init__(
+        self,
+        requests_per_minute: float = 15,
+        tokens_per_minute: float = 1_000_000,
+        initial_concurrency: float = 4,
+        min_concurrency: float = 1,
+        max_concurrency: float = 32,
+        latency_target: float = 10.0,
+        decrease_factor: float = 0.5,
+        decrease_cooldown: float = 2.0,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._waiters: list[tuple[int, int, float, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+        self._timer_loop: asyncio.AbstractEventLoop | None = None
+
+    async def acquire(self, priority: int = INTERACTIVE, tokens: float = 0) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), tokens, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just before the cancellation arrived
+                self.release()
+            raise
+
+    def release(self, latency: float | None = None, throttled: bool = False) -> None:
+        self.in_flight -= 1
+        now = time.monotonic()
+        if throttled or (latency is not None and latency > self.latency_target):
+            if now - self._last_decrease >= self.decrease_cooldown:
+                self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+                self._last_decrease = now
+        elif latency is not None:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+        self._dispatch()
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every queued request for ``seconds`` (e.g. a Retry-After)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _dispatch(self) -> None:
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            # Waiters left behind by a loop that has since closed can never be woken
+            if future.done() or future.get_loop().is_closed():
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= max(1, int(self.limit)):
+                return
+            wait = max(
+                self._paused_until - time.monotonic(),
+                self.requests.wait_time(1),
+                self.tokens.wait_time(tokens),
+            )
+            if wait > 0:
+                self._schedule(wait)
+                return
+            heapq.heappop(self._waiters)
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _schedule(self, wait: float) -> None:
+        loop = asyncio.get_running_loop()
+        # The limiter is shared, so a pending timer may belong to a loop that has closed
+        if self._timer is not None and self._timer_loop is loop and not self._timer.cancelled():
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_later(wait, self._on_timer)
+        self._timer_loop = loop
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._timer_loop = None
+        self._dispatch()
+
+
+# ------------------ Transport ------------------
+
+def _parse_retry_after(response: httpx.Response) -> float | None:
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parsed = email.utils.parsedate_to_datetime(value)
+    if parsed is None:
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+def _inspect_request(request: httpx.Request) -> tuple[float, bool]:
+    """Return (estimated tokens, is streaming) for a chat completions request."""
+    body = request.content
+    try:
+        payload = json.loads(body) if body else {}
+    except ValueError:
+        return len(body) / 4, False
+    if not isinstance(payload, dict):
+        return len(body) / 4, False
+    completion = payload.get("max_tokens") or payload.get("max_completion_tokens") or 0
+    # Roughly four bytes per token for the prompt
+    return len(body) / 4 + completion, bool(payload.get("stream"))
+
+
+class _SlotReleasingStream(httpx.AsyncByteStream):
+    """Response body that frees the limiter slot when it is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[], None]):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._on_close()
+
+
+class AdaptiveTransport(httpx.AsyncBaseTransport):
+    """httpx transport that applies an ``AdaptiveLimiter`` and retries throttled requests."""
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport | None = None,
+        limiter: AdaptiveLimiter | None = None,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 30.0,
+        registry: Telemetry | None = None,
+    ):
+        self.transport = transport if transport is not None else httpx.AsyncHTTPTransport()
+        self.limiter = limiter if limiter is not None else AdaptiveLimiter()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.registry = registry
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2**attempt))
+
+    def _record_retry(self, reason: str) -> None:
+        if self.registry is not None:
+            self.registry.inc("agent_gemini_retries_total", reason=reason)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        estimate, streaming = _inspect_request(request)
+        level = request_priority.get()
+        attempt = 0
+        while True:
+            await self.limiter.acquire(level, estimate)
+            start = time.monotonic()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except BaseException as e:
+                # Cancellation (timeouts, guardrail tripwires) must free the slot too
+                self.limiter.release()
+                if not isinstance(e, httpx.TransportError) or attempt >= self.max_retries:
+                    raise
+                self._record_retry("connection")
+                await asyncio.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+
+            if response.status_code in RETRY_STATUSES:
+                # Errors never count as fast successes; 429/503 also shrink concurrency
+                self.limiter.release(throttled=response.status_code in THROTTLE_STATUSES)
+                if attempt >= self.max_retries:
+                    return response
+                delay = _parse_retry_after(response)
+                if delay is not None:
+                    self.limiter.pause(delay)
+                else:
+                    delay = self.backoff(attempt)
+                self._record_retry(str(response.status_code))
+                await response.aclose()
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            if not response.is_success:
+                self.limiter.release()
+                return response
+
+            # Hold the slot until the body is fully read or the stream is closed, so
+            # streamed completions count as in flight and latency covers the whole body
+            release_slot = self._slot_releaser(start)
+            if response.is_closed:
+                # Body already in memory (e.g. a stub response), nothing left in flight
+                release_slot()
+            else:
+                response.stream = _SlotReleasingStream(response.stream, release_slot)
+            if not streaming:
+                try:
+                    await self._reconcile_tokens(response, estimate)
+                except BaseException:
+                    await response.aclose()
+                    raise
+            return response
+
+    def _slot_releaser(self, start: float) -> Callable[[], None]:
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.limiter.release(time.monotonic() - start)
+
+        return release
+
+    async def _reconcile_tokens(self, response: httpx.Response, estimate: float) -> None:
+        await response.aread()
+        try:
+            usage = response.json().get("usage") or {}
+        except ValueError:
+            return
+        actual = usage.get("total_tokens")
+        if isinstance(actual, (int, float)):
+            self.limiter.tokens.adjust(estimate - actual)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+# ------------------ Shared Client ------------------
+
+_shared_client: AsyncOpenAI | None = None
+
+
+def create_gemini_client(
+    api_key: str | None = None,
+    transport: httpx.AsyncBaseTransport | None = None,
+    limiter: AdaptiveLimiter | None = None,
+    registry: Telemetry | None = None,
+    base_url: str = GEMINI_BASE_URL,
+) -> AsyncOpenAI:
+    """Build a new rate-limited client. Pass ``transport`` to target a local stub."""
+    if limiter is None:
+        limiter = AdaptiveLimiter(
+            requests_per_minute=float(os.getenv("GEMINI_RPM", "15")),
+            tokens_per_minute=float(os.getenv("GEMINI_TPM", "1000000")),
+        )
+    return AsyncOpenAI(
+        api_key=api_key or os.getenv("GEMINI_API_KEY"),
+        base_url=base_url,
+        # Retries are handled by AdaptiveTransport so they pass through the limiter
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(
+            transport=AdaptiveTransport(transport, limiter, registry=registry)
+        ),
+    )
+
+
+def get_gemini_client(api_key: str | None = None) -> AsyncOpenAI:
+    """Return the process-wide rate-limited Gemini client, creating it on first use."""
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = create_gemini_client(api_key)
+    return _shared_client
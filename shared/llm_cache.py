@@ -0,0 +1,385 @@
+"""Content-addressed response cache for agent model calls.
+
+Wrap any ``Model`` (usually ``OpenAIChatCompletionsModel``) in ``CachedModel``
+and pass it as an agent's ``model=`` or as ``RunConfig(model=...)``. Only the
+agents that receive the wrapped model use the cache.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator
+
+from agents import ModelSettings, ModelTracing
+from agents.agent_output import AgentOutputSchemaBase
+from agents.handoffs import Handoff
+from agents.items import ModelResponse, TResponseInputItem, TResponseOutputItem, TResponseStreamEvent
+from agents.models.interface import Model
+from agents.tool import FunctionTool, Tool
+from agents.usage import Usage
+from openai.types.responses.response_usage import InputTokensDetails, OutputTokensDetails
+from pydantic import TypeAdapter, ValidationError
+
+from shared.models import model_name_of
+
+
+# ------------------ Cache Key ------------------
+
+def _tool_fingerprint(tool: Tool) -> dict[str, Any]:
+    if isinstance(tool, FunctionTool):
+        return {
+            "name": tool.name,
+            "description": tool.description,
+            "params": tool.params_json_schema,
+        }
+    return {"name": getattr(tool, "name", type(tool).__name__)}
+
+
+def make_cache_key(
+    model_name: str,
+    system_instructions: str | None,
+    input: str | list[TResponseInputItem],
+    model_settings: ModelSettings,
+    tools: list[Tool],
+    output_schema: AgentOutputSchemaBase | None,
+    handoffs: list[Handoff],
+    previous_response_id: str | None = None,
+) -> str:
+    """Return a SHA-256 hex digest identifying one model request."""
+    payload = {
+        "model": model_name,
+        "instructions": system_instructions,
+        "input": input,
+        "settings": model_settings.to_json_dict(),
+        "tools": [_tool_fingerprint(t) for t in tools],
+        "output_schema": output_schema.json_schema() if output_schema and not output_schema.is_plain_text() else None,
+        "handoffs": [h.tool_name for h in handoffs],
+        "previous_response_id": previous_response_id,
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ------------------ Storage Tiers ------------------
+
+class MemoryLRU:
+    """In-process LRU tier with a per-entry TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float | None = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, stored_at: float | None = None) -> None:
+        with self._lock:
+            self._data[key] = (stored_at if stored_at is not None else time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteStore:
+    """Persistent tier backed by a single SQLite file holding JSON text.
+
+    Eviction removes the least recently used rows once ``max_entries`` is exceeded.
+    Reads never write: last-use times are buffered and flushed with the next ``set``.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10_000, ttl: float | None = 7 * 24 * 3600.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._pending_use: dict[str, float] = {}
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " stored_at REAL NOT NULL,"
+            " used_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> tuple[float, str] | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, stored_at = row
+            # Expired rows are removed by the next eviction pass
+            if self.ttl is not None and now - stored_at > self.ttl:
+                return None
+            self._pending_use[key] = now
+        if not isinstance(value, str):
+            return None
+        return stored_at, value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._flush_use()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, stored_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._pending_use.pop(key, None)
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _flush_use(self) -> None:
+        if self._pending_use:
+            self._conn.executemany(
+                "UPDATE responses SET used_at = ? WHERE key = ?",
+                [(used_at, key) for key, used_at in self._pending_use.items()],
+            )
+            self._pending_use.clear()
+
+    def _evict(self) -> None:
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.ttl,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY used_at ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pending_use.clear()
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_use()
+            self._conn.commit()
+            self._conn.close()
+
+
+# ------------------ Serialisation ------------------
+
+_output_items = TypeAdapter(list[TResponseOutputItem])
+
+
+def dump_response(response: ModelResponse) -> str:
+    """Encode a ``ModelResponse`` as JSON for the persistent tier."""
+    usage = response.usage
+    return json.dumps(
+        {
+            "output": [item.model_dump(mode="json") for item in response.output],
+            "usage": {
+                "requests": usage.requests,
+                "input_tokens": usage.input_tokens,
+                "input_tokens_details": usage.input_tokens_details.model_dump(mode="json"),
+                "output_tokens": usage.output_tokens,
+                "output_tokens_details": usage.output_tokens_details.model_dump(mode="json"),
+                "total_tokens": usage.total_tokens,
+            },
+            "response_id": response.response_id,
+        }
+    )
+
+
+def load_response(raw: str) -> ModelResponse:
+    """Decode JSON written by ``dump_response``."""
+    data = json.loads(raw)
+    usage = data["usage"]
+    return ModelResponse(
+        output=_output_items.validate_python(data["output"]),
+        usage=Usage(
+            requests=usage["requests"],
+            input_tokens=usage["input_tokens"],
+            input_tokens_details=InputTokensDetails.model_validate(usage["input_tokens_details"]),
+            output_tokens=usage["output_tokens"],
+            output_tokens_details=OutputTokensDetails.model_validate(usage["output_tokens_details"]),
+            total_tokens=usage["total_tokens"],
+        ),
+        response_id=data["response_id"],
+    )
+
+
+class ResponseCache:
+    """Two-tier cache: memory LRU in front of an optional persistent store."""
+
+    def __init__(self, memory: MemoryLRU | None = None, disk: SQLiteStore | None = None):
+        self.memory = memory if memory is not None else MemoryLRU()
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        """Build a cache from ``LLM_CACHE_PATH`` (disk tier, optional) and ``LLM_CACHE_TTL``."""
+        ttl = float(os.getenv("LLM_CACHE_TTL", "3600"))
+        path = os.getenv("LLM_CACHE_PATH")
+        disk = SQLiteStore(path, ttl=ttl) if path else None
+        return cls(memory=MemoryLRU(ttl=ttl), disk=disk)
+
+    def get(self, key: str) -> ModelResponse | None:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                stored_at, raw = entry
+                try:
+                    value = load_response(raw)
+                except (ValueError, KeyError, TypeError, ValidationError):
+                    # Unreadable entry (e.g. written by an incompatible SDK version)
+                    self.disk.delete(key)
+                else:
+                    self.memory.set(key, value, stored_at=stored_at)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, response: ModelResponse) -> None:
+        self.memory.set(key, response)
+        if self.disk is not None:
+            self.disk.set(key, dump_response(response))
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+# ------------------ Model Wrapper ------------------
+
+class CachedModel(Model):
+    """``Model`` wrapper that serves repeated deterministic requests from a ``ResponseCache``.
+
+    A request is cacheable when its temperature is at most ``max_temperature``.
+    Calls without a temperature use the provider default (1.0 for Gemini) and are
+    only cached with ``cache_unset_temperature=True``. Streaming calls always go to
+    the wrapped model.
+    """
+
+    def __init__(
+        self,
+        model: Model,
+        cache: ResponseCache | None = None,
+        max_temperature: float = 0.2,
+        cache_unset_temperature: bool = False,
+    ):
+        self.model = model
+        self.cache = cache if cache is not None else ResponseCache()
+        self.max_temperature = max_temperature
+        self.cache_unset_temperature = cache_unset_temperature
+
+    @property
+    def model_name(self) -> str:
+        return model_name_of(self.model)
+
+    def is_cacheable(self, model_settings: ModelSettings) -> bool:
+        if model_settings.temperature is None:
+            return self.cache_unset_temperature
+        return model_settings.temperature <= self.max_temperature
+
+    async def get_response(
+        self,
+        system_instructions: str | None,
+        input: str | list[TResponseInputItem],
+        model_settings: ModelSettings,
+        tools: list[Tool],
+        output_schema: AgentOutputSchemaBase | None,
+        handoffs: list[Handoff],
+        tracing: ModelTracing,
+        *,
+        previous_response_id: str | None,
+        prompt: Any | None = None,
+    ) -> ModelResponse:
+        key = None
+        if prompt is None and self.is_cacheable(model_settings):
+            key = make_cache_key(
+                self.model_name,
+                system_instructions,
+                input,
+                model_settings,
+                tools,
+                output_schema,
+                handoffs,
+                previous_response_id,
+            )
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        response = await self.model.get_response(
+            system_instructions,
+            input,
+            model_settings,
+            tools,
+            output_schema,
+            handoffs,
+            tracing,
+            previous_response_id=previous_response_id,
+            prompt=prompt,
+        )
+        if key is not None:
+            self.cache.set(key, response)
+        return response
+
+    def stream_response(
+        self,
+        system_instructions: str | None,
+        input: str | list[TResponseInputItem],
+        model_settings: ModelSettings,
+        tools: list[Tool],
+        output_schema: AgentOutputSchemaBase | None,
+        handoffs: list[Handoff],
+        tracing: ModelTracing,
+        *,
+        previous_response_id: str | None,
+        prompt: Any | None = None,
+    ) -> AsyncIterator[TResponseStreamEvent]:
+        return self.model.stream_response(
+            system_instructions,
+            input,
+            model_settings,
+            tools,
+            output_schema,
+            handoffs,
+            tracing,
+            previous_response_id=previous_response_id,
+            prompt=prompt,
+        )
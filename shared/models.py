@@ -0,0 +1,19 @@
+"""Small helpers shared by the ``Model`` wrappers."""
+
+from typing import Any
+
+
+def model_name_of(model: Any) -> str:
+    """Return the underlying model name, looking through wrapper models."""
+    # Bounded walk in case a wrapper points back at itself
+    for _ in range(16):
+        name = getattr(model, "model_name", None)
+        if isinstance(name, str):
+            return name
+        inner = getattr(model, "model", None)
+        if isinstance(inner, str):
+            return inner
+        if inner is None:
+            break
+        model = inner
+    return type(model).__name__
@@ -0,0 +1,299 @@
+"""Request coalescing (single-flight) for identical in-flight calls.
+
+Concurrent callers with the same key share one in-flight call and its result.
+Nothing is kept once the call finishes, so there is no staleness.
+
+- ``SingleFlightModel(model)`` coalesces identical model requests
+- ``@coalesce()`` coalesces calls to a plain or async function (e.g. an HTTP fetch used by a tool)
+"""
+
+import asyncio
+import functools
+import inspect
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, TypeVar
+
+from agents import ModelSettings, ModelTracing
+from agents.agent_output import AgentOutputSchemaBase
+from agents.handoffs import Handoff
+from agents.items import ModelResponse, TResponseInputItem, TResponseStreamEvent
+from agents.models.interface import Model
+from agents.tool import Tool
+
+from shared.llm_cache import make_cache_key
+from shared.models import model_name_of
+from shared.telemetry import Telemetry
+
+T = TypeVar("T")
+
+
+# ------------------ Coalescing Groups ------------------
+
+class _FlightStats:
+    def __init__(self, name: str, registry: Telemetry | None):
+        self.name = name
+        self.registry = registry
+        self.issued = 0
+        self.coalesced = 0
+
+    def _record(self, outcome: str) -> None:
+        if outcome == "issued":
+            self.issued += 1
+        else:
+            self.coalesced += 1
+        if self.registry is not None:
+            self.registry.inc("agent_singleflight_calls_total", flight=self.name, outcome=outcome)
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight(_FlightStats):
+    """Coalesces concurrent awaitables that share a key on the same event loop.
+
+    The shared call runs in its own task. Cancelling one caller only detaches that
+    caller; the task is cancelled once no callers are left waiting for it.
+    """
+
+    def __init__(self, name: str = "default", registry: Telemetry | None = None):
+        super().__init__(name, registry)
+        self._inflight: dict[Any, _Flight] = {}
+        self._lock = threading.Lock()
+
+    async def do(self, key: Any, fn: Callable[[], Awaitable[T]]) -> T:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flight = self._inflight.get(key)
+            if flight is not None and flight.task.get_loop() is loop:
+                outcome = "coalesced"
+            else:
+                outcome = "issued"
+                flight = self._start(key, fn, register=flight is None)
+            flight.waiters += 1
+        self._record(outcome)
+
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            with self._lock:
+                detach_last = flight.waiters == 1 and not flight.task.done()
+                # Unregister before cancelling so a caller arriving now starts a fresh call
+                # instead of joining the dying task
+                if detach_last and self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            if detach_last:
+                flight.task.cancel()
+            raise
+        finally:
+            with self._lock:
+                flight.waiters -= 1
+
+    def _start(self, key: Any, fn: Callable[[], Awaitable[T]], register: bool) -> _Flight:
+        async def run() -> T:
+            return await fn()
+
+        flight = _Flight(asyncio.get_running_loop().create_task(run()))
+
+        def done(task: asyncio.Task) -> None:
+            with self._lock:
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            if not task.cancelled():
+                # Mark retrieved so a flight whose callers all left does not log a warning
+                task.exception()
+
+        flight.task.add_done_callback(done)
+        if register:
+            self._inflight[key] = flight
+        return flight
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class ThreadSingleFlight(_FlightStats):
+    """Coalesces concurrent blocking calls that share a key across threads."""
+
+    def __init__(self, name: str = "default", registry: Telemetry | None = None):
+        super().__init__(name, registry)
+        self._inflight: dict[Any, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Any, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if call is None:
+                call = self._inflight[key] = _Call()
+
+        if not leader:
+            self._record("coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        self._record("issued")
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+
+
+def _default_key(*args: Any, **kwargs: Any) -> Any:
+    return repr((args, sorted(kwargs.items())))
+
+
+def coalesce(
+    key: Callable[..., Any] | None = None,
+    name: str | None = None,
+    registry: Telemetry | None = None,
+    run_in_thread: bool = False,
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorator that coalesces concurrent calls with the same arguments.
+
+    ``key`` maps the call arguments to a hashable key; by default the repr of all arguments.
+
+    ``async`` functions are coalesced across tasks on one event loop. Plain functions are
+    coalesced across threads only: the SDK runs sync ``@function_tool`` functions directly on
+    the event loop, so concurrent sessions never overlap inside them. For a blocking fetch used
+    by async tools, pass ``run_in_thread=True``; the decorated function then becomes ``async``
+    and runs ``func`` through ``asyncio.to_thread``.
+    """
+    key_fn = key or _default_key
+
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        flight_name = name or func.__name__
+        if inspect.iscoroutinefunction(func) or run_in_thread:
+            group = SingleFlight(flight_name, registry)
+            if inspect.iscoroutinefunction(func):
+                call = func
+            else:
+                call = functools.partial(asyncio.to_thread, func)
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                return await group.do(key_fn(*args, **kwargs), lambda: call(*args, **kwargs))
+
+            async_wrapper.single_flight = group  # type: ignore[attr-defined]
+            return async_wrapper  # type: ignore[return-value]
+
+        thread_group = ThreadSingleFlight(flight_name, registry)
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            return thread_group.do(key_fn(*args, **kwargs), lambda: func(*args, **kwargs))
+
+        wrapper.single_flight = thread_group  # type: ignore[attr-defined]
+        return wrapper
+
+    return decorator
+
+
+# ------------------ Model Wrapper ------------------
+
+class SingleFlightModel(Model):
+    """``Model`` wrapper that shares one in-flight request between identical concurrent calls.
+
+    ``key`` receives the same arguments as ``get_response`` (minus ``tracing``) and returns
+    a key, or ``None`` to skip coalescing. By default every request is keyed by its content.
+    """
+
+    def __init__(
+        self,
+        model: Model,
+        key: Callable[..., Any] | None = None,
+        name: str | None = None,
+        registry: Telemetry | None = None,
+    ):
+        self.model = model
+        self.key = key
+        self.flight = SingleFlight(name or model_name_of(model), registry)
+
+    @property
+    def model_name(self) -> str:
+        return model_name_of(self.model)
+
+    def _make_key(self, *args: Any) -> Any:
+        if self.key is not None:
+            return self.key(*args)
+        return make_cache_key(self.model_name, *args)
+
+    async def get_response(
+        self,
+        system_instructions: str | None,
+        input: str | list[TResponseInputItem],
+        model_settings: ModelSettings,
+        tools: list[Tool],
+        output_schema: AgentOutputSchemaBase | None,
+        handoffs: list[Handoff],
+        tracing: ModelTracing,
+        *,
+        previous_response_id: str | None,
+        prompt: Any | None = None,
+    ) -> ModelResponse:
+        def call() -> Awaitable[ModelResponse]:
+            return self.model.get_response(
+                system_instructions,
+                input,
+                model_settings,
+                tools,
+                output_schema,
+                handoffs,
+                tracing,
+                previous_response_id=previous_response_id,
+                prompt=prompt,
+            )
+
+        key = None
+        if prompt is None:
+            key = self._make_key(
+                system_instructions,
+                input,
+                model_settings,
+                tools,
+                output_schema,
+                handoffs,
+                previous_response_id,
+            )
+        if key is None:
+            return await call()
+        return await self.flight.do(key, call)
+
+    def stream_response(
+        self,
+        system_instructions: str | None,
+        input: str | list[TResponseInputItem],
+        model_settings: ModelSettings,
+        tools: list[Tool],
+        output_schema: AgentOutputSchemaBase | None,
+        handoffs: list[Handoff],
+        tracing: ModelTracing,
+        *,
+        previous_response_id: str | None,
+        prompt: Any | None = None,
+    ) -> AsyncIterator[TResponseStreamEvent]:
+        return self.model.stream_response(
+            system_instructions,
+            input,
+            model_settings,
+            tools,
+            output_schema,
+            handoffs,
+            tracing,
+            previous_response_id=previous_response_id,
+            prompt=prompt,
+        )
@@ -0,0 +1,403 @@
+"""In-process token, call and latency telemetry for agents and tools.
+
+Works with tracing disabled. Wrap the pieces you want to observe:
+
+- ``InstrumentedModel(model, agent_name=...)`` for model calls
+- ``@instrument_function`` under ``@function_tool`` for tool calls, errors and latency
+- ``instrument_guardrail(guardrail)`` for input/output guardrails
+
+and export with ``telemetry.to_prometheus()`` or ``JsonSnapshotter``.
+"""
+
+import bisect
+import dataclasses
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, TypeVar
+
+from agents import ModelSettings, ModelTracing
+from agents.agent_output import AgentOutputSchemaBase
+from agents.guardrail import InputGuardrail, OutputGuardrail
+from agents.handoffs import Handoff
+from agents.items import ModelResponse, TResponseInputItem, TResponseStreamEvent
+from agents.models.interface import Model
+from agents.tool import FunctionTool, Tool
+
+from shared.models import model_name_of
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_HELP = {
+    "agent_model_calls_total": "Model calls issued per agent.",
+    "agent_model_errors_total": "Model calls that raised per agent.",
+    "agent_input_tokens_total": "Input tokens sent per agent.",
+    "agent_output_tokens_total": "Output tokens received per agent.",
+    "agent_model_latency_seconds": "Model call latency per agent.",
+    "agent_tool_calls_total": "Tool invocations per tool.",
+    "agent_tool_errors_total": "Tool invocations that raised per tool.",
+    "agent_tool_latency_seconds": "Tool invocation latency per tool.",
+    "agent_guardrail_checks_total": "Guardrail evaluations per guardrail.",
+    "agent_guardrail_trips_total": "Guardrail tripwires triggered per guardrail.",
+    "agent_singleflight_calls_total": "Single-flight calls per group, issued or coalesced.",
+    "agent_gemini_retries_total": "Gemini requests retried, by status code or connection error.",
+}
+
+Labels = tuple[tuple[str, str], ...]
+
+
+# ------------------ Registry ------------------
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Telemetry:
+    """Thread-safe registry of labelled counters and latency histograms."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters: dict[tuple[str, Labels], float] = {}
+        self._histograms: dict[tuple[str, Labels], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, metric: str, amount: float = 1, **labels: str) -> None:
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, metric: str, value: float, **labels: str) -> None:
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def record_model_call(
+        self, agent: str, latency: float, input_tokens: int = 0, output_tokens: int = 0, error: bool = False
+    ) -> None:
+        self.inc("agent_model_calls_total", agent=agent)
+        if error:
+            self.inc("agent_model_errors_total", agent=agent)
+        if input_tokens:
+            self.inc("agent_input_tokens_total", input_tokens, agent=agent)
+        if output_tokens:
+            self.inc("agent_output_tokens_total", output_tokens, agent=agent)
+        self.observe("agent_model_latency_seconds", latency, agent=agent)
+
+    def record_tool_call(self, tool: str, latency: float, error: bool = False) -> None:
+        self.inc("agent_tool_calls_total", tool=tool)
+        if error:
+            self.inc("agent_tool_errors_total", tool=tool)
+        self.observe("agent_tool_latency_seconds", latency, tool=tool)
+
+    def record_guardrail(self, guardrail: str, tripped: bool) -> None:
+        self.inc("agent_guardrail_checks_total", guardrail=guardrail)
+        if tripped:
+            self.inc("agent_guardrail_trips_total", guardrail=guardrail)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    # ------------------ Export ------------------
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return all metrics as a JSON-serialisable dict."""
+        with self._lock:
+            counters = [
+                {"metric": metric, "labels": dict(labels), "value": value}
+                for (metric, labels), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                {
+                    "metric": metric,
+                    "labels": dict(labels),
+                    "buckets": dict(zip([str(b) for b in h.buckets] + ["+Inf"], h.counts)),
+                    "sum": h.sum,
+                    "count": h.count,
+                }
+                for (metric, labels), h in sorted(self._histograms.items())
+            ]
+        return {"timestamp": time.time(), "counters": counters, "histograms": histograms}
+
+    def to_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (list(h.counts), h.sum, h.count)) for key, h in self._histograms.items()
+            )
+        lines: list[str] = []
+        seen: set[str] = set()
+
+        def header(metric: str, kind: str) -> None:
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# HELP {metric} {METRIC_HELP.get(metric, metric)}")
+                lines.append(f"# TYPE {metric} {kind}")
+
+        for (metric, labels), value in counters:
+            header(metric, "counter")
+            lines.append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+        for (metric, labels), (counts, total, count) in histograms:
+            header(metric, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + [float("inf")], counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{metric}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels:
+        value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class JsonSnapshotter:
+    """Background thread that writes ``telemetry.snapshot()`` to a JSON file every ``interval`` seconds."""
+
+    def __init__(self, telemetry: "Telemetry", path: str, interval: float = 60.0):
+        self.telemetry = telemetry
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="telemetry-snapshot", daemon=True)
+
+    def start(self) -> "JsonSnapshotter":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.write()
+
+    def write(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.telemetry.snapshot(), f)
+        os.replace(tmp_path, self.path)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.write()
+
+
+telemetry = Telemetry()
+
+
+# ------------------ Model Wrapper ------------------
+
+class InstrumentedModel(Model):
+    """``Model`` wrapper that records calls, tokens, errors and latency under ``agent_name``."""
+
+    def __init__(self, model: Model, agent_name: str | None = None, registry: Telemetry | None = None):
+        self.model = model
+        self.agent_name = agent_name or model_name_of(model)
+        self.registry = registry if registry is not None else telemetry
+
+    @property
+    def model_name(self) -> str:
+        return model_name_of(self.model)
+
+    async def get_response(
+        self,
+        system_instructions: str | None,
+        input: str | list[TResponseInputItem],
+        model_settings: ModelSettings,
+        tools: list[Tool],
+        output_schema: AgentOutputSchemaBase | None,
+        handoffs: list[Handoff],
+        tracing: ModelTracing,
+        *,
+        previous_response_id: str | None,
+        prompt: Any | None = None,
+    ) -> ModelResponse:
+        start = time.perf_counter()
+        input_tokens = output_tokens = 0
+        error = False
+        try:
+            response = await self.model.get_response(
+                system_instructions,
+                input,
+                model_settings,
+                tools,
+                output_schema,
+                handoffs,
+                tracing,
+                previous_response_id=previous_response_id,
+                prompt=prompt,
+            )
+            input_tokens = response.usage.input_tokens
+            output_tokens = response.usage.output_tokens
+            return response
+        except Exception:
+            error = True
+            raise
+        finally:
+            # Also runs on cancellation, which is recorded as a call but not an error
+            self.registry.record_model_call(
+                self.agent_name, time.perf_counter() - start, input_tokens, output_tokens, error=error
+            )
+
+    async def stream_response(
+        self,
+        system_instructions: str | None,
+        input: str | list[TResponseInputItem],
+        model_settings: ModelSettings,
+        tools: list[Tool],
+        output_schema: AgentOutputSchemaBase | None,
+        handoffs: list[Handoff],
+        tracing: ModelTracing,
+        *,
+        previous_response_id: str | None,
+        prompt: Any | None = None,
+    ) -> AsyncIterator[TResponseStreamEvent]:
+        start = time.perf_counter()
+        input_tokens = output_tokens = 0
+        error = False
+        try:
+            async for event in self.model.stream_response(
+                system_instructions,
+                input,
+                model_settings,
+                tools,
+                output_schema,
+                handoffs,
+                tracing,
+                previous_response_id=previous_response_id,
+                prompt=prompt,
+            ):
+                if event.type == "response.completed" and event.response.usage is not None:
+                    input_tokens = event.response.usage.input_tokens
+                    output_tokens = event.response.usage.output_tokens
+                yield event
+        except Exception:
+            error = True
+            raise
+        finally:
+            # Also runs when the consumer closes the stream early (GeneratorExit) or is cancelled
+            self.registry.record_model_call(
+                self.agent_name, time.perf_counter() - start, input_tokens, output_tokens, error=error
+            )
+
+
+# ------------------ Tool & Guardrail Wrappers ------------------
+
+def instrument_function(
+    func: F | None = None, *, name: str | None = None, registry: Telemetry | None = None
+) -> Any:
+    """Decorator recording calls, errors and latency of a tool function.
+
+    Apply it below ``@function_tool`` so exceptions are seen before the SDK's
+    ``failure_error_function`` turns them into an error message for the model::
+
+        @function_tool
+        @instrument_function
+        def get_country_capital(country: str) -> str: ...
+    """
+
+    def decorator(fn: F) -> F:
+        tool_name = name or fn.__name__
+        reg = registry if registry is not None else telemetry
+
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                start = time.perf_counter()
+                try:
+                    result = await fn(*args, **kwargs)
+                except Exception:
+                    reg.record_tool_call(tool_name, time.perf_counter() - start, error=True)
+                    raise
+                reg.record_tool_call(tool_name, time.perf_counter() - start)
+                return result
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                reg.record_tool_call(tool_name, time.perf_counter() - start, error=True)
+                raise
+            reg.record_tool_call(tool_name, time.perf_counter() - start)
+            return result
+
+        return wrapper  # type: ignore[return-value]
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def instrument_tool(tool: FunctionTool, registry: Telemetry | None = None) -> FunctionTool:
+    """Return a copy of an already built ``tool`` whose invocations are recorded in ``registry``.
+
+    Errors are only counted when they propagate, i.e. for tools built with
+    ``failure_error_function=None``; otherwise use ``instrument_function``.
+    """
+    registry = registry if registry is not None else telemetry
+    invoke = tool.on_invoke_tool
+
+    async def on_invoke_tool(ctx: Any, arguments: str) -> Any:
+        start = time.perf_counter()
+        try:
+            result = await invoke(ctx, arguments)
+        except Exception:
+            registry.record_tool_call(tool.name, time.perf_counter() - start, error=True)
+            raise
+        registry.record_tool_call(tool.name, time.perf_counter() - start)
+        return result
+
+    return dataclasses.replace(tool, on_invoke_tool=on_invoke_tool)
+
+
+def instrument_guardrail(
+    guardrail: InputGuardrail | OutputGuardrail, registry: Telemetry | None = None
+) -> InputGuardrail | OutputGuardrail:
+    """Return a copy of ``guardrail`` that counts checks and tripwire triggers."""
+    registry = registry if registry is not None else telemetry
+    name = guardrail.get_name()
+    check = guardrail.guardrail_function
+
+    async def guardrail_function(*args: Any) -> Any:
+        output = check(*args)
+        if inspect.isawaitable(output):
+            output = await output
+        registry.record_guardrail(name, output.tripwire_triggered)
+        return output
+
+    return dataclasses.replace(guardrail, guardrail_function=guardrail_function, name=name)
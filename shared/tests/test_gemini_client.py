@@ -0,0 +1,283 @@
+"""Stub-server tests for the rate-limited Gemini client (no network)."""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from shared.gemini_client import (
+    BATCH,
+    INTERACTIVE,
+    AdaptiveLimiter,
+    AdaptiveTransport,
+    create_gemini_client,
+    priority,
+)
+
+URL = "https://stub.test/v1/chat/completions"
+
+
+def completion(content: str = "ok") -> httpx.Response:
+    return httpx.Response(
+        200,
+        json={
+            "id": "stub",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gemini-2.0-flash",
+            "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+            ],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7},
+        },
+    )
+
+
+def make_transport(handler, limiter: AdaptiveLimiter | None = None, **kwargs) -> AdaptiveTransport:
+    limiter = limiter or AdaptiveLimiter(requests_per_minute=6000, initial_concurrency=4)
+    kwargs.setdefault("backoff_base", 0.01)
+    return AdaptiveTransport(httpx.MockTransport(handler), limiter, **kwargs)
+
+
+def post(client: httpx.AsyncClient, content: str = "hi"):
+    return client.post(URL, json={"model": "gemini-2.0-flash", "messages": [{"role": "user", "content": content}]})
+
+
+def test_retries_429_and_honours_retry_after():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"retry-after": "0.3"})
+        return completion()
+
+    transport = make_transport(handler)
+
+    async def main():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await post(client)
+
+    response = asyncio.run(main())
+    assert response.status_code == 200
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.3
+
+
+def test_gives_up_after_max_retries():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(503)
+
+    transport = make_transport(handler, max_retries=2)
+
+    async def main():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await post(client)
+
+    assert asyncio.run(main()).status_code == 503
+    assert len(calls) == 3
+    assert transport.limiter.in_flight == 0
+
+
+def test_aimd_decreases_on_429_and_increases_on_success():
+    responses = iter([httpx.Response(429, headers={"retry-after": "0"}), completion(), completion()])
+    limiter = AdaptiveLimiter(requests_per_minute=6000, initial_concurrency=8, decrease_cooldown=0)
+    transport = make_transport(lambda request: next(responses), limiter)
+
+    async def main():
+        async with httpx.AsyncClient(transport=transport) as client:
+            # Halved by the 429, then +1/limit for the successful retry
+            await post(client)
+            assert limiter.limit == 4.25
+            await post(client)
+
+    asyncio.run(main())
+    assert limiter.limit == pytest.approx(4.25 + 1 / 4.25)
+
+
+def test_interactive_requests_go_before_batch():
+    order = []
+    state = {}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        content = request.read().decode()
+        if "first" in content:
+            await state["gate"].wait()
+        order.append(next(word for word in ("first", "batch", "interactive") if word in content))
+        return completion()
+
+    limiter = AdaptiveLimiter(requests_per_minute=6000, initial_concurrency=1, max_concurrency=1)
+    transport = make_transport(handler, limiter)
+
+    async def send(client, content, level):
+        with priority(level):
+            await post(client, content)
+
+    async def main():
+        state["gate"] = asyncio.Event()
+        async with httpx.AsyncClient(transport=transport) as client:
+            first = asyncio.create_task(send(client, "first", INTERACTIVE))
+            await asyncio.sleep(0.05)
+            queued = [asyncio.create_task(send(client, "batch", BATCH)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            queued.append(asyncio.create_task(send(client, "interactive", INTERACTIVE)))
+            await asyncio.sleep(0.01)
+            state["gate"].set()
+            await asyncio.gather(first, *queued)
+
+    asyncio.run(main())
+    assert order == ["first", "interactive", "batch", "batch"]
+
+
+def test_cancelled_request_frees_its_slot():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if b"slow" in request.read():
+            await asyncio.sleep(10)
+        return completion()
+
+    limiter = AdaptiveLimiter(requests_per_minute=6000, initial_concurrency=1, max_concurrency=1)
+    transport = make_transport(handler, limiter)
+
+    async def main():
+        async with httpx.AsyncClient(transport=transport) as client:
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(post(client, "slow"), 0.1)
+            assert limiter.in_flight == 0
+            response = await asyncio.wait_for(post(client, "fast"), 1)
+            assert response.status_code == 200
+
+    asyncio.run(main())
+
+
+def test_limiter_survives_a_closed_event_loop():
+    # One request per second, with the bucket drained by the first acquire
+    limiter = AdaptiveLimiter(requests_per_minute=60, initial_concurrency=4)
+    limiter.requests.tokens = 1
+
+    async def first_loop():
+        await limiter.acquire()
+        limiter.release()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.acquire(), 0.05)
+
+    async def second_loop():
+        await asyncio.wait_for(limiter.acquire(), 2)
+        limiter.release()
+
+    asyncio.run(first_loop())
+    start = time.monotonic()
+    asyncio.run(second_loop())
+    assert time.monotonic() - start < 2
+
+
+def test_openai_client_against_stub():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) < 3:
+            return httpx.Response(429, headers={"retry-after": "0"}, json={"error": {"message": "slow down"}})
+        return completion("hello")
+
+    limiter = AdaptiveLimiter(requests_per_minute=6000)
+    client = create_gemini_client("test-key", transport=httpx.MockTransport(handler), limiter=limiter)
+
+    async def main():
+        result = await client.chat.completions.create(
+            model="gemini-2.0-flash", messages=[{"role": "user", "content": "hi"}]
+        )
+        await client.close()
+        return result
+
+    result = asyncio.run(main())
+    assert result.choices[0].message.content == "hello"
+    assert len(calls) == 3
+    assert limiter.in_flight == 0
+
+
+def test_server_errors_never_increase_concurrency():
+    limiter = AdaptiveLimiter(requests_per_minute=6000, initial_concurrency=4, decrease_cooldown=0)
+    overloaded = make_transport(lambda request: httpx.Response(503, headers={"retry-after": "0"}), limiter, max_retries=7)
+
+    async def main(transport):
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await post(client)
+
+    assert asyncio.run(main(overloaded)).status_code == 503
+    assert limiter.limit == limiter.min_concurrency
+
+    limiter = AdaptiveLimiter(requests_per_minute=6000, initial_concurrency=4)
+    failing = make_transport(lambda request: httpx.Response(500), limiter, max_retries=7)
+    assert asyncio.run(main(failing)).status_code == 500
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
+
+
+async def slow_body(chunks: list[bytes], delay: float):
+    for chunk in chunks:
+        await asyncio.sleep(delay)
+        yield chunk
+
+
+def test_streamed_response_holds_its_slot_until_closed():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=slow_body([b"data: a\n\n", b"data: b\n\n"], 0.1))
+
+    limiter = AdaptiveLimiter(requests_per_minute=6000, initial_concurrency=4, latency_target=0.15)
+    transport = make_transport(handler, limiter)
+    body = {"model": "gemini-2.0-flash", "stream": True, "messages": [{"role": "user", "content": "hi"}]}
+
+    async def main():
+        async with httpx.AsyncClient(transport=transport) as client:
+            async with client.stream("POST", URL, json=body) as response:
+                assert limiter.in_flight == 1
+                chunks = [chunk async for chunk in response.aiter_bytes()]
+            assert limiter.in_flight == 0
+            return b"".join(chunks)
+
+    assert asyncio.run(main()) == b"data: a\n\ndata: b\n\n"
+    # Latency covers the whole body (~0.2s), which is over the target
+    assert limiter.limit == 2
+
+
+def test_streamed_response_closed_early_frees_its_slot():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=slow_body([b"a", b"b", b"c"], 0.01))
+
+    limiter = AdaptiveLimiter(requests_per_minute=6000, initial_concurrency=1, max_concurrency=1)
+    transport = make_transport(handler, limiter)
+    body = {"model": "gemini-2.0-flash", "stream": True, "messages": []}
+
+    async def main():
+        async with httpx.AsyncClient(transport=transport) as client:
+            async with client.stream("POST", URL, json=body) as response:
+                async for _ in response.aiter_bytes():
+                    break
+            assert limiter.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_network_body_is_read_before_the_slot_is_freed():
+    payload = completion().content
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={"content-type": "application/json"}, content=slow_body([payload], 0.01))
+
+    # One token a second, so refills during the test stay negligible
+    limiter = AdaptiveLimiter(requests_per_minute=6000, tokens_per_minute=60)
+    transport = make_transport(handler, limiter)
+
+    async def main():
+        async with httpx.AsyncClient(transport=transport) as client:
+            response = await post(client)
+            assert limiter.in_flight == 0
+            return response
+
+    assert asyncio.run(main()).json()["usage"]["total_tokens"] == 7
+    # The up-front estimate was reconciled against the reported usage
+    assert limiter.tokens.tokens == pytest.approx(60 - 7, abs=0.5)
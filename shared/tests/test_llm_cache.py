@@ -0,0 +1,215 @@
+"""Tests for the content-addressed response cache, using an in-memory stub model."""
+
+import asyncio
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from agents import ModelSettings, ModelTracing
+from agents.items import ModelResponse
+from agents.models.interface import Model
+from agents.usage import Usage
+from openai.types.responses import ResponseOutputMessage, ResponseOutputText
+
+from shared.llm_cache import (
+    CachedModel,
+    MemoryLRU,
+    ResponseCache,
+    SQLiteStore,
+    dump_response,
+    load_response,
+    make_cache_key,
+)
+
+
+def make_response(text: str = "hi") -> ModelResponse:
+    message = ResponseOutputMessage(
+        id="msg_1",
+        content=[ResponseOutputText(text=text, type="output_text", annotations=[])],
+        role="assistant",
+        status="completed",
+        type="message",
+    )
+    return ModelResponse(
+        output=[message],
+        usage=Usage(requests=1, input_tokens=3, output_tokens=2, total_tokens=5),
+        response_id=None,
+    )
+
+
+class StubModel(Model):
+    model = "gemini-2.0-flash"
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def get_response(self, *args, previous_response_id=None, prompt=None):
+        self.calls += 1
+        return make_response(f"call {self.calls}")
+
+    def stream_response(self, *args, previous_response_id=None, prompt=None):
+        raise NotImplementedError
+
+
+class WrapperModel(StubModel):
+    """Stands in for another wrapper (e.g. InstrumentedModel) around the real model."""
+
+    def __init__(self, model: Model) -> None:
+        super().__init__()
+        self.model = model
+
+
+def ask(model: Model, text: str = "hello", temperature: float | None = 0.0) -> ModelResponse:
+    return asyncio.run(
+        model.get_response(
+            "Be brief.",
+            text,
+            ModelSettings(temperature=temperature),
+            [],
+            None,
+            [],
+            ModelTracing.DISABLED,
+            previous_response_id=None,
+            prompt=None,
+        )
+    )
+
+
+def text_of(response: ModelResponse) -> str:
+    return response.output[0].content[0].text
+
+
+# ------------------ Keys ------------------
+
+def test_key_is_stable_across_processes():
+    args = ("gemini-2.0-flash", "Be brief.", "hello", ModelSettings(temperature=0.0), [], None, [])
+    code = (
+        "from agents import ModelSettings\n"
+        "from shared.llm_cache import make_cache_key\n"
+        "print(make_cache_key('gemini-2.0-flash', 'Be brief.', 'hello', ModelSettings(temperature=0.0), [], None, []))"
+    )
+    root = str(Path(__file__).resolve().parents[2])
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    # A fresh interpreter has a different hash seed and different object addresses
+    other = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env)
+    assert other.stdout.strip() == make_cache_key(*args)
+
+
+def test_key_uses_underlying_model_name_through_wrappers():
+    cached = CachedModel(WrapperModel(StubModel()))
+    assert cached.model_name == "gemini-2.0-flash"
+
+
+def test_key_changes_with_settings():
+    base = ("gemini-2.0-flash", "Be brief.", "hello")
+    assert make_cache_key(*base, ModelSettings(temperature=0.0), [], None, []) != make_cache_key(
+        *base, ModelSettings(temperature=0.0, max_tokens=10), [], None, []
+    )
+
+
+# ------------------ Temperature Gate ------------------
+
+def test_low_temperature_calls_are_cached():
+    stub = StubModel()
+    model = CachedModel(stub)
+    assert text_of(ask(model)) == text_of(ask(model)) == "call 1"
+    assert stub.calls == 1
+
+
+def test_high_temperature_calls_are_not_cached():
+    stub = StubModel()
+    model = CachedModel(stub)
+    ask(model, temperature=0.9)
+    ask(model, temperature=0.9)
+    assert stub.calls == 2
+
+
+def test_unset_temperature_requires_opt_in():
+    stub = StubModel()
+    ask(CachedModel(stub), temperature=None)
+    ask(CachedModel(stub), temperature=None)
+    assert stub.calls == 2
+
+    opted_in = CachedModel(stub, cache_unset_temperature=True)
+    ask(opted_in, temperature=None)
+    ask(opted_in, temperature=None)
+    assert stub.calls == 3
+
+
+# ------------------ Memory Tier ------------------
+
+def test_memory_lru_evicts_least_recently_used():
+    lru = MemoryLRU(max_entries=2, ttl=None)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1 and lru.get("c") == 3
+
+
+def test_memory_lru_expires_entries():
+    lru = MemoryLRU(ttl=60)
+    lru.set("old", 1, stored_at=0)
+    lru.set("new", 2)
+    assert lru.get("old") is None
+    assert lru.get("new") == 2
+
+
+# ------------------ SQLite Tier ------------------
+
+def test_sqlite_store_expires_entries(tmp_path):
+    store = SQLiteStore(str(tmp_path / "cache.sqlite"), ttl=60)
+    store.set("a", "{}")
+    store._conn.execute("UPDATE responses SET stored_at = 0")
+    assert store.get("a") is None
+
+
+def test_sqlite_store_evicts_least_recently_used(tmp_path):
+    store = SQLiteStore(str(tmp_path / "cache.sqlite"), max_entries=2, ttl=None)
+    store.set("a", "1")
+    store.set("b", "2")
+    store._conn.execute("UPDATE responses SET used_at = 0 WHERE key = 'b'")
+    store.get("a")
+    store.set("c", "3")
+    assert store.get("b") is None
+    assert store.get("a")[1] == "1" and store.get("c")[1] == "3"
+
+
+def test_sqlite_reads_do_not_write(tmp_path):
+    store = SQLiteStore(str(tmp_path / "cache.sqlite"))
+    store.set("a", "1")
+    before = store._conn.total_changes
+    store.get("a")
+    assert store._conn.total_changes == before
+
+
+def test_response_round_trips_through_json():
+    response = make_response("round trip")
+    loaded = load_response(dump_response(response))
+    assert [item.model_dump() for item in loaded.output] == [item.model_dump() for item in response.output]
+    assert loaded.usage.total_tokens == 5
+    assert loaded.response_id is None
+
+
+def test_disk_tier_hits_after_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    first = StubModel()
+    cache = ResponseCache(disk=SQLiteStore(path))
+    ask(CachedModel(first, cache))
+    cache.disk.close()
+
+    second = StubModel()
+    restarted = ResponseCache(disk=SQLiteStore(path))
+    assert text_of(ask(CachedModel(second, restarted))) == "call 1"
+    assert second.calls == 0
+    assert restarted.hits == 1
+
+
+def test_unreadable_disk_entry_is_a_miss(tmp_path):
+    store = SQLiteStore(str(tmp_path / "cache.sqlite"))
+    store.set("bad", "not json")
+    cache = ResponseCache(disk=store)
+    assert cache.get("bad") is None
+    assert store.get("bad") is None
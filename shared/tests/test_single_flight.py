@@ -0,0 +1,203 @@
+"""Tests for single-flight request coalescing."""
+
+import asyncio
+import threading
+import time
+
+from agents import ModelSettings, ModelTracing
+from agents.items import ModelResponse
+from agents.models.interface import Model
+from agents.usage import Usage
+
+from shared.single_flight import SingleFlight, SingleFlightModel, coalesce
+from shared.telemetry import Telemetry
+
+
+class SlowCall:
+    """Awaitable factory that counts starts and cancellations."""
+
+    def __init__(self, delay: float = 0.1, result: str = "done") -> None:
+        self.delay = delay
+        self.result = result
+        self.started = 0
+        self.cancelled = 0
+
+    async def __call__(self) -> str:
+        self.started += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return self.result
+
+
+# ------------------ SingleFlight ------------------
+
+def test_concurrent_callers_share_one_call():
+    registry = Telemetry()
+    flight = SingleFlight("test", registry)
+    work = SlowCall()
+
+    async def main():
+        return await asyncio.gather(*[flight.do("k", work) for _ in range(5)])
+
+    assert asyncio.run(main()) == ["done"] * 5
+    assert work.started == 1
+    assert (flight.issued, flight.coalesced) == (1, 4)
+    prometheus = registry.to_prometheus()
+    assert 'agent_singleflight_calls_total{flight="test",outcome="coalesced"} 4' in prometheus
+
+
+def test_errors_reach_every_caller():
+    flight = SingleFlight()
+
+    async def boom():
+        await asyncio.sleep(0.05)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(flight.do("k", boom), flight.do("k", boom), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert [type(r) for r in results] == [ValueError, ValueError]
+    assert flight.issued == 1
+
+
+def test_cancelling_leader_only_detaches_it():
+    flight = SingleFlight()
+    work = SlowCall()
+
+    async def main():
+        leader = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        assert await follower == "done"
+        assert leader.cancelled()
+
+    asyncio.run(main())
+    assert work.started == 1
+    assert work.cancelled == 0
+
+
+def test_last_waiter_cancelling_cancels_the_call():
+    flight = SingleFlight()
+    work = SlowCall(delay=10)
+
+    async def main():
+        callers = [asyncio.create_task(flight.do("k", work)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert work.cancelled == 1
+    assert flight._inflight == {}
+
+
+def test_caller_joining_while_flight_is_cancelled_starts_fresh():
+    flight = SingleFlight()
+    work = SlowCall(delay=0.05)
+
+    async def main():
+        first = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        # Starts before the cancelled task has finished unwinding
+        second = asyncio.create_task(flight.do("k", work))
+        assert await second == "done"
+        assert not second.cancelled()
+        assert first.cancelled()
+
+    asyncio.run(main())
+    assert work.started == 2
+    assert flight.issued == 2
+
+
+# ------------------ coalesce ------------------
+
+def test_coalesce_sync_function_across_threads():
+    calls = []
+
+    @coalesce()
+    def fetch(country: str) -> str:
+        calls.append(country)
+        time.sleep(0.1)
+        return country.upper()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(fetch("pk"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["PK"] * 4
+    assert calls == ["pk"]
+    assert fetch.single_flight.coalesced == 3
+
+
+def test_coalesce_run_in_thread_across_sessions():
+    calls = []
+
+    @coalesce(key=lambda country: country.lower(), run_in_thread=True)
+    def fetch(country: str) -> str:
+        calls.append(country)
+        time.sleep(0.1)
+        return "Islamabad"
+
+    async def main():
+        return await asyncio.gather(fetch("Pakistan"), fetch("pakistan"), fetch("PAKISTAN"))
+
+    assert asyncio.run(main()) == ["Islamabad"] * 3
+    assert len(calls) == 1
+
+
+# ------------------ SingleFlightModel ------------------
+
+class StubModel(Model):
+    model = "gemini-2.0-flash"
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    async def get_response(self, *args, previous_response_id=None, prompt=None):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return ModelResponse(output=[], usage=Usage(requests=1), response_id=None)
+
+    def stream_response(self, *args, previous_response_id=None, prompt=None):
+        raise NotImplementedError
+
+
+def ask(model: Model, text: str):
+    return model.get_response(
+        None, text, ModelSettings(), [], None, [], ModelTracing.DISABLED, previous_response_id=None, prompt=None
+    )
+
+
+def test_model_coalesces_identical_requests_only():
+    stub = StubModel()
+    model = SingleFlightModel(stub)
+
+    async def main():
+        await asyncio.gather(ask(model, "a"), ask(model, "a"), ask(model, "a"), ask(model, "b"))
+
+    asyncio.run(main())
+    assert stub.calls == 2
+    assert model.flight.name == "gemini-2.0-flash"
+
+
+def test_model_key_returning_none_skips_coalescing():
+    stub = StubModel()
+    model = SingleFlightModel(stub, key=lambda *args: None)
+
+    async def main():
+        await asyncio.gather(ask(model, "a"), ask(model, "a"))
+
+    asyncio.run(main())
+    assert stub.calls == 2
@@ -0,0 +1,221 @@
+"""Tests for the in-process telemetry registry and its wrappers."""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from agents import (
+    Agent,
+    GuardrailFunctionOutput,
+    ModelSettings,
+    ModelTracing,
+    RunContextWrapper,
+    function_tool,
+    input_guardrail,
+    output_guardrail,
+)
+from agents.items import ModelResponse
+from agents.models.interface import Model
+from agents.tool_context import ToolContext
+from agents.usage import Usage
+
+from shared.telemetry import (
+    LATENCY_BUCKETS,
+    InstrumentedModel,
+    Telemetry,
+    instrument_function,
+    instrument_guardrail,
+)
+
+
+def counter(registry: Telemetry, metric: str, **labels: str) -> float | None:
+    for entry in registry.snapshot()["counters"]:
+        if entry["metric"] == metric and entry["labels"] == labels:
+            return entry["value"]
+    return None
+
+
+def histogram(registry: Telemetry, metric: str, **labels: str) -> dict:
+    return next(
+        entry
+        for entry in registry.snapshot()["histograms"]
+        if entry["metric"] == metric and entry["labels"] == labels
+    )
+
+
+# ------------------ Registry & Export ------------------
+
+def test_histogram_buckets_are_inclusive_upper_bounds():
+    registry = Telemetry()
+    for value in (0.005, 0.006, 0.3, 100.0):
+        registry.observe("agent_tool_latency_seconds", value, tool="t")
+    entry = histogram(registry, "agent_tool_latency_seconds", tool="t")
+    assert entry["buckets"]["0.005"] == 1
+    assert entry["buckets"]["0.01"] == 1
+    assert entry["buckets"]["0.5"] == 1
+    assert entry["buckets"]["+Inf"] == 1
+    assert entry["count"] == 4
+    assert entry["sum"] == pytest.approx(100.311)
+
+
+def test_prometheus_output():
+    registry = Telemetry()
+    registry.record_tool_call("lookup", 0.02)
+    registry.record_tool_call("lookup", 2.0, error=True)
+    registry.inc("agent_model_calls_total", agent='Say "hi"\\')
+
+    lines = registry.to_prometheus().splitlines()
+    assert "# TYPE agent_tool_calls_total counter" in lines
+    assert 'agent_tool_calls_total{tool="lookup"} 2' in lines
+    assert 'agent_tool_errors_total{tool="lookup"} 1' in lines
+    assert 'agent_model_calls_total{agent="Say \\"hi\\"\\\\"} 1' in lines
+    assert "# TYPE agent_tool_latency_seconds histogram" in lines
+    # Buckets are cumulative and end with +Inf
+    assert 'agent_tool_latency_seconds_bucket{tool="lookup",le="0.01"} 0' in lines
+    assert 'agent_tool_latency_seconds_bucket{tool="lookup",le="0.025"} 1' in lines
+    assert 'agent_tool_latency_seconds_bucket{tool="lookup",le="2.5"} 2' in lines
+    assert 'agent_tool_latency_seconds_bucket{tool="lookup",le="+Inf"} 2' in lines
+    assert 'agent_tool_latency_seconds_count{tool="lookup"} 2' in lines
+    buckets = [line for line in lines if line.startswith("agent_tool_latency_seconds_bucket")]
+    assert len(buckets) == len(LATENCY_BUCKETS) + 1
+
+
+def test_snapshot_is_json_serialisable():
+    registry = Telemetry()
+    registry.record_model_call("A", 0.1, input_tokens=3, output_tokens=2)
+    snapshot = json.loads(json.dumps(registry.snapshot()))
+    assert counter(registry, "agent_input_tokens_total", agent="A") == 3
+    assert snapshot["histograms"][0]["count"] == 1
+
+
+# ------------------ Tools & Guardrails ------------------
+
+def test_instrument_function_counts_errors_hidden_by_function_tool():
+    registry = Telemetry()
+
+    @function_tool
+    @instrument_function(registry=registry)
+    def lookup(country: str) -> str:
+        """Look up a country."""
+        raise RuntimeError(country)
+
+    @function_tool
+    @instrument_function(registry=registry)
+    async def echo(country: str) -> str:
+        return country
+
+    assert lookup.name == "lookup"
+    assert list(lookup.params_json_schema["properties"]) == ["country"]
+    ctx = ToolContext(context=None, tool_name="lookup", tool_call_id="1")
+    result = asyncio.run(lookup.on_invoke_tool(ctx, json.dumps({"country": "pk"})))
+    assert result.startswith("An error occurred")
+    assert asyncio.run(echo.on_invoke_tool(ctx, json.dumps({"country": "pk"}))) == "pk"
+
+    assert counter(registry, "agent_tool_calls_total", tool="lookup") == 1
+    assert counter(registry, "agent_tool_errors_total", tool="lookup") == 1
+    assert counter(registry, "agent_tool_calls_total", tool="echo") == 1
+    assert counter(registry, "agent_tool_errors_total", tool="echo") is None
+
+
+def test_instrument_guardrail_counts_trips():
+    registry = Telemetry()
+
+    @input_guardrail
+    def off_topic(ctx, agent, input):
+        return GuardrailFunctionOutput(output_info=None, tripwire_triggered="weather" in input)
+
+    @output_guardrail
+    async def unsafe(ctx, agent, output):
+        return GuardrailFunctionOutput(output_info=None, tripwire_triggered=False)
+
+    agent = Agent(name="A")
+    ctx = RunContextWrapper(context=None)
+    guarded_input = instrument_guardrail(off_topic, registry)
+    guarded_output = instrument_guardrail(unsafe, registry)
+
+    async def main():
+        await guarded_input.run(agent, "book search", ctx)
+        result = await guarded_input.run(agent, "weather?", ctx)
+        assert result.output.tripwire_triggered
+        await guarded_output.run(ctx, agent, "ok")
+
+    asyncio.run(main())
+    assert counter(registry, "agent_guardrail_checks_total", guardrail="off_topic") == 2
+    assert counter(registry, "agent_guardrail_trips_total", guardrail="off_topic") == 1
+    assert counter(registry, "agent_guardrail_checks_total", guardrail="unsafe") == 1
+    assert counter(registry, "agent_guardrail_trips_total", guardrail="unsafe") is None
+
+
+# ------------------ Model Wrapper ------------------
+
+class StubModel(Model):
+    model = "gemini-2.0-flash"
+
+    def __init__(self, behaviour: str = "ok") -> None:
+        self.behaviour = behaviour
+
+    async def get_response(self, *args, previous_response_id=None, prompt=None):
+        if self.behaviour == "error":
+            raise RuntimeError("boom")
+        if self.behaviour == "hang":
+            await asyncio.sleep(10)
+        return ModelResponse(
+            output=[], usage=Usage(requests=1, input_tokens=3, output_tokens=2, total_tokens=5), response_id=None
+        )
+
+    async def stream_response(self, *args, previous_response_id=None, prompt=None):
+        for _ in range(3):
+            yield SimpleNamespace(type="response.output_text.delta")
+
+
+def call(model: Model):
+    return model.get_response(
+        None, "hi", ModelSettings(), [], None, [], ModelTracing.DISABLED, previous_response_id=None, prompt=None
+    )
+
+
+def test_model_calls_record_tokens_and_errors():
+    registry = Telemetry()
+    asyncio.run(call(InstrumentedModel(StubModel(), "A", registry)))
+    with pytest.raises(RuntimeError):
+        asyncio.run(call(InstrumentedModel(StubModel("error"), "A", registry)))
+    assert counter(registry, "agent_model_calls_total", agent="A") == 2
+    assert counter(registry, "agent_model_errors_total", agent="A") == 1
+    assert counter(registry, "agent_input_tokens_total", agent="A") == 3
+    assert counter(registry, "agent_output_tokens_total", agent="A") == 2
+
+
+def test_cancelled_model_call_is_recorded_but_not_an_error():
+    registry = Telemetry()
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(call(InstrumentedModel(StubModel("hang"), "A", registry)), 0.05)
+
+    asyncio.run(main())
+    assert counter(registry, "agent_model_calls_total", agent="A") == 1
+    assert counter(registry, "agent_model_errors_total", agent="A") is None
+    assert histogram(registry, "agent_model_latency_seconds", agent="A")["count"] == 1
+
+
+def test_early_closed_stream_is_recorded_but_not_an_error():
+    registry = Telemetry()
+    model = InstrumentedModel(StubModel(), "A", registry)
+
+    async def main():
+        stream = model.stream_response(
+            None, "hi", ModelSettings(), [], None, [], ModelTracing.DISABLED, previous_response_id=None, prompt=None
+        )
+        async for _ in stream:
+            break
+        await stream.aclose()
+
+    asyncio.run(main())
+    assert counter(registry, "agent_model_calls_total", agent="A") == 1
+    assert counter(registry, "agent_model_errors_total", agent="A") is None
+
+
+def test_agent_label_defaults_to_underlying_model_name():
+    inner = InstrumentedModel(StubModel(), "inner", Telemetry())
+    assert InstrumentedModel(inner, registry=Telemetry()).agent_name == "gemini-2.0-flash"